@@ -7,21 +7,34 @@ from __future__ import annotations
 
 import abc
 import argparse
-import configparser
 import contextlib
 import datetime
 import ftplib
+import functools
 import io
+import os
+import posixpath
 import re
+import shlex
+import shutil
 import subprocess
 import tempfile
-from dataclasses import dataclass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Collection
 
 
 class FileUploader(abc.ABC):
     """Base class for file uploading."""
 
+    # Whether several uploads may run at the same time from different threads
+    concurrent_uploads = False
+
     def __init__(self, config: FileupConfig) -> None:
         """Initialize the uploader."""
         self.config = config
@@ -30,6 +43,17 @@ class FileUploader(abc.ABC):
     def upload_file(self, local_path: Path, remote_filename: str) -> None:
         """Upload a file to the remote server."""
 
+    def upload_bytes(self, data: bytes, remote_filename: str) -> None:
+        """Upload in-memory data to the remote server."""
+        with tempfile.NamedTemporaryFile() as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            self.upload_file(Path(tmp_file.name), remote_filename)
+
+    def upload_empty(self, remote_filename: str) -> None:
+        """Create an empty file on the remote server."""
+        self.upload_bytes(b"", remote_filename)
+
     @abc.abstractmethod
     def list_files(self) -> list[str]:
         """List files in the remote directory."""
@@ -38,10 +62,34 @@ class FileUploader(abc.ABC):
     def delete_file(self, filename: str) -> None:
         """Delete a file from the remote server."""
 
+    def delete_files(
+        self,
+        filenames: list[str],
+        *,
+        ignore_missing: Collection[str] = (),
+    ) -> None:
+        """Delete several files.
+
+        Failures to delete the files in ``ignore_missing``, which may already
+        be gone, are reported instead of raising.
+        """
+        ignore_missing = set(ignore_missing)
+        for filename in filenames:
+            try:
+                self.delete_file(filename)
+            except Exception as e:  # noqa: PERF203
+                if filename not in ignore_missing:
+                    raise
+                print(f"Error: {e}")
+
     def cleanup(self) -> None:  # noqa: B027
         """Cleanup resources."""
 
 
+# Send file data in 1 MiB chunks instead of ftplib's default of 8 KiB
+_FTP_BLOCKSIZE = 1 << 20
+
+
 class FTPUploader(FileUploader):
     """FTP implementation of FileUploader."""
 
@@ -61,16 +109,34 @@ class FTPUploader(FileUploader):
 
     def upload_file(self, local_path: Path, remote_filename: str) -> None:
         """Upload a file using FTP."""
-        if not local_path.exists():
-            # For marker files, create an empty file
-            self.ftp.storbinary(f"STOR {remote_filename}", io.BytesIO())
-        else:
-            with local_path.open("rb") as file:
-                self.ftp.storbinary(f"STOR {remote_filename}", file)
+        with local_path.open("rb") as file:
+            self.ftp.storbinary(
+                f"STOR {remote_filename}",
+                file,
+                blocksize=_FTP_BLOCKSIZE,
+            )
+
+    def upload_bytes(self, data: bytes, remote_filename: str) -> None:
+        """Upload in-memory data using FTP."""
+        self.ftp.storbinary(
+            f"STOR {remote_filename}",
+            io.BytesIO(data),
+            blocksize=_FTP_BLOCKSIZE,
+        )
 
     def list_files(self) -> list[str]:
-        """List files using FTP."""
-        return self.ftp.nlst()
+        """List files using FTP, preferring MLSD over NLST."""
+        try:
+            # MLSD is well defined, skips directories, and does not fail on
+            # an empty directory like NLST does on some servers
+            return [
+                name
+                for name, facts in self.ftp.mlsd()
+                # Fact values are case-insensitive, ftplib only lowercases names
+                if facts.get("type", "file").lower() == "file"
+            ]
+        except ftplib.error_perm:  # server does not support MLSD
+            return self.ftp.nlst()
 
     def delete_file(self, filename: str) -> None:
         """Delete a file using FTP."""
@@ -81,79 +147,168 @@ class FTPUploader(FileUploader):
         self.ftp.quit()
 
 
-class SCPUploader(FileUploader):
-    """SCP implementation of FileUploader."""
+def _quote_remote_path(path: str) -> str:
+    """Quote a path for the remote shell, leaving a leading ``~/`` unquoted.
 
-    def upload_file(self, local_path: Path, remote_filename: str) -> None:
-        """Upload a file using SCP."""
-        remote_path = (
-            Path(self.config.base_folder) / self.config.file_up_folder / remote_filename
-        )
+    A quoted ``~`` is not expanded to the home directory by the remote shell.
+    """
+    if path == "~":
+        return path
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:])
+    return shlex.quote(path)
 
-        # Use hostname directly, which can be from SSH config
-        host_str = (
-            f"{self.config.username}@{self.config.hostname}"
-            if self.config.username
-            else self.config.hostname
-        )
 
-        cmd = ["scp", "-q"]  # quiet mode
+class SSHError(subprocess.CalledProcessError):
+    """A failed ssh/scp command, with its stderr in the message."""
 
-        # Add private key if specified
-        if self.config.private_key:
-            cmd.extend(["-i", self.config.private_key])
+    def __str__(self) -> str:
+        """Describe the failure with the decoded stderr of the command."""
+        stderr = (self.stderr or b"").decode(errors="replace").strip()
+        return f"{self.cmd[0]} failed with exit code {self.returncode}: {stderr}"
 
-        cmd.extend([str(local_path), f"{host_str}:{remote_path}"])
 
-        subprocess.run(cmd, check=True, capture_output=True)  # noqa: S603
+class SCPUploader(FileUploader):
+    """SCP implementation of FileUploader."""
 
-    def list_files(self) -> list[str]:
-        """List files using SSH."""
-        remote_path = Path(self.config.base_folder) / self.config.file_up_folder
+    # Every call is a separate process sharing the ControlMaster connection
+    concurrent_uploads = True
 
-        host_str = (
-            f"{self.config.username}@{self.config.hostname}"
-            if self.config.username
-            else self.config.hostname
+    def __init__(self, config: FileupConfig) -> None:
+        """Initialize the SCP uploader."""
+        super().__init__(config)
+        # All ssh/scp calls share one multiplexed connection through a socket
+        # in this directory, which is only created once a command needs it
+        self._control_dir: str | None = None
+        self._control_lock = threading.Lock()
+        self._options: list[str] | None = None
+
+        # Remote paths are always POSIX, so build them as plain strings
+        self._remote_dir = posixpath.normpath(
+            posixpath.join(config.base_folder, config.file_up_folder),
         )
 
-        cmd = ["ssh"]
-
-        # Add private key if specified
-        if self.config.private_key:
-            cmd.extend(["-i", self.config.private_key])
-
-        cmd.extend([host_str, f"ls -1 {remote_path}"])
-
-        result = subprocess.run(  # noqa: S603
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True,
+        # Use hostname directly, which can be from SSH config
+        self._host_str = (
+            f"{config.username}@{config.hostname}"
+            if config.username
+            else config.hostname
         )
-        return result.stdout.splitlines()
 
-    def delete_file(self, filename: str) -> None:
-        """Delete a file using SSH."""
-        remote_path = (
-            Path(self.config.base_folder) / self.config.file_up_folder / filename
-        )
+    def _ssh_options(self) -> list[str]:
+        """Return the options shared by ssh and scp.
+
+        They point every call at one ControlMaster socket, whose directory is
+        created on the first call.
+        """
+        with self._control_lock:
+            if self._options is None:
+                self._control_dir = tempfile.mkdtemp(prefix="fileup-")
+                control_path = Path(self._control_dir) / "ssh.sock"
+                self._options = [
+                    "-o",
+                    "ControlMaster=auto",
+                    "-o",
+                    f"ControlPath={control_path}",
+                    "-o",
+                    "ControlPersist=60s",
+                ]
+                # Use the private key if specified
+                if self.config.private_key:
+                    self._options.extend(["-i", self.config.private_key])
+            return self._options
+
+    @staticmethod
+    def _run(
+        cmd: list[str],
+        *,
+        data: bytes | None = None,
+        stdout: int = subprocess.DEVNULL,
+    ) -> subprocess.CompletedProcess[bytes]:
+        """Run an ssh/scp command, only keeping stderr around for errors."""
+        try:
+            return subprocess.run(  # noqa: S603
+                cmd,
+                input=data,
+                check=True,
+                stdout=stdout,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as e:
+            raise SSHError(e.returncode, e.cmd, e.output, e.stderr) from e
 
-        host_str = (
-            f"{self.config.username}@{self.config.hostname}"
-            if self.config.username
-            else self.config.hostname
+    def upload_file(self, local_path: Path, remote_filename: str) -> None:
+        """Upload a file using SCP."""
+        cmd = ["scp", "-q", *self._ssh_options()]  # quiet mode
+        cmd.extend(
+            [
+                str(local_path),
+                f"{self._host_str}:{self._remote_dir}/{remote_filename}",
+            ],
         )
+        self._run(cmd)
 
-        cmd = ["ssh"]
+    def upload_bytes(self, data: bytes, remote_filename: str) -> None:
+        """Upload in-memory data by piping it through SSH."""
+        remote_path = _quote_remote_path(f"{self._remote_dir}/{remote_filename}")
+        cmd = ["ssh", *self._ssh_options(), self._host_str, f"cat > {remote_path}"]
+        self._run(cmd, data=data)
 
-        # Add private key if specified
-        if self.config.private_key:
-            cmd.extend(["-i", self.config.private_key])
+    def list_files(self) -> list[str]:
+        """List files using SSH."""
+        remote_dir = _quote_remote_path(self._remote_dir)
+        cmd = ["ssh", *self._ssh_options(), self._host_str, f"ls -1 {remote_dir}"]
+        result = self._run(cmd, stdout=subprocess.PIPE)
+        return result.stdout.decode().splitlines()
 
-        cmd.extend([host_str, f"rm {remote_path}"])
+    def delete_file(self, filename: str) -> None:
+        """Delete a file using SSH."""
+        remote_path = _quote_remote_path(f"{self._remote_dir}/{filename}")
+        cmd = ["ssh", *self._ssh_options(), self._host_str, f"rm {remote_path}"]
+        self._run(cmd)
+
+    def delete_files(
+        self,
+        filenames: list[str],
+        *,
+        ignore_missing: Collection[str] = (),  # noqa: ARG002
+    ) -> None:
+        """Delete several files using a single SSH command.
+
+        ``rm -f`` already skips missing files, so ``ignore_missing`` is unused.
+        """
+        if not filenames:
+            return
+        names = " ".join(shlex.quote(filename) for filename in filenames)
+        remote_dir = _quote_remote_path(self._remote_dir)
+        cmd = [
+            "ssh",
+            *self._ssh_options(),
+            self._host_str,
+            f"cd {remote_dir} && rm -f -- {names}",
+        ]
+        self._run(cmd)
 
-        subprocess.run(cmd, check=True, capture_output=True)  # noqa: S603
+    def cleanup(self) -> None:
+        """Close the shared SSH connection."""
+        if self._control_dir is None:
+            return
+        control_path = Path(self._control_dir) / "ssh.sock"
+        if control_path.exists():
+            cmd = ["ssh", "-o", f"ControlPath={control_path}"]
+            cmd.extend(["-O", "exit", self._host_str])
+            subprocess.run(  # noqa: S603
+                cmd,
+                check=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+        self._control_dir = None
+        self._options = None
+
+
+_VALID_FILENAME_RE = re.compile(r"[^-\w.]", re.UNICODE)
 
 
 def get_valid_filename(s: str) -> str:
@@ -166,8 +321,7 @@ def get_valid_filename(s: str) -> str:
     >>> get_valid_filename("john's portrait in 2004.jpg")
     'johns_portrait_in_2004.jpg'.
     """
-    s = s.strip().replace(" ", "_")
-    return re.sub(r"(?u)[^-\w.]", "", s)
+    return _VALID_FILENAME_RE.sub("", s.strip().replace(" ", "_"))
 
 
 @dataclass
@@ -184,28 +338,43 @@ class FileupConfig:
     private_key: str | None = None
 
 
-def read_config() -> FileupConfig:
-    """Read the config file."""
-    config = configparser.ConfigParser()
-    config_path = Path("~/.config/fileup/config.ini").expanduser()
-    if not config_path.exists():
-        msg = (
-            f"Config file not found at {config_path}. "
-            "Please create one following the documentation."
-        )
-        raise FileNotFoundError(msg)
-
-    config.read(config_path)
+_SECTION_RE = re.compile(r"^\[([^\]]+)\]")
+_KV_RE = re.compile(r"^([^:=\s]+)\s*[:=]\s*(.*)$")
+
+
+def _parse_ini(text: str) -> dict[str, dict[str, str]]:
+    """Parse the subset of the INI format that the config file uses."""
+    sections: dict[str, dict[str, str]] = {}
+    section: dict[str, str] | None = None
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line or line[0] in "#;":
+            continue
+        match = _SECTION_RE.match(line)
+        if match:
+            section = sections.setdefault(match.group(1), {})
+            continue
+        match = _KV_RE.match(line)
+        if match and section is not None:
+            section[match.group(1).lower()] = match.group(2).strip()
+    return sections
+
+
+@functools.lru_cache(maxsize=4)
+def _load_config(path: str, mtime_ns: int) -> FileupConfig:  # noqa: ARG001
+    """Parse the config file, cached on its path and modification time."""
+    config = _parse_ini(Path(path).read_text())
     protocol = config["default"]["protocol"]
     if protocol not in {"ftp", "scp"}:
         msg = f"Invalid protocol: {protocol}"
         raise ValueError(msg)
 
     # Get protocol specific settings
-    username = config.get(protocol, "username", fallback=None)
-    password = config.get(protocol, "password", fallback=None)
-    private_key = config.get(protocol, "private_key", fallback=None)
-    url = config.get("default", "url", fallback=config["default"]["hostname"])
+    protocol_section = config.get(protocol, {})
+    username = protocol_section.get("username")
+    password = protocol_section.get("password")
+    private_key = protocol_section.get("private_key")
+    url = config["default"].get("url", config["default"]["hostname"])
 
     return FileupConfig(
         protocol=protocol,
@@ -219,23 +388,78 @@ def read_config() -> FileupConfig:
     )
 
 
-def remove_old_files(uploader: FileUploader, today: datetime.date) -> None:
-    """Remove all files that are past the limit."""
-    files = [f for f in uploader.list_files() if "_delete_on_" in f]
-    file_dates = [f.rsplit("_delete_on_", 1) for f in files]
-    for file_name, date in file_dates:
-        rm_date = (
-            datetime.datetime.strptime(date, "%Y-%m-%d")
-            .replace(tzinfo=datetime.timezone.utc)
-            .date()
+def read_config() -> FileupConfig:
+    """Read the config file."""
+    config_path = Path("~/.config/fileup/config.ini").expanduser()
+    try:
+        mtime_ns = config_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        msg = (
+            f"Config file not found at {config_path}. "
+            "Please create one following the documentation."
         )
-        if rm_date < today:
+        raise FileNotFoundError(msg) from None
+
+    config = _load_config(str(config_path), mtime_ns)
+    # Return a copy so callers cannot modify the cached instance
+    return replace(config)
+
+
+_MARKER_RE = re.compile(r"^(.+)_delete_on_(\d{4}-\d{2}-\d{2})$")
+
+
+def remove_old_files(
+    uploader: FileUploader,
+    today: datetime.date,
+    files: list[str] | None = None,
+    *,
+    replacing: str | None = None,
+) -> set[str]:
+    """Remove all files that are past the limit.
+
+    ``files`` is a listing of the remote directory, fetched from the uploader
+    if not given. The markers of ``replacing``, a file that is about to be
+    uploaded again, are removed in the same batch. Returns the set of deletion
+    markers that were removed.
+    """
+    if files is None:
+        files = uploader.list_files()
+    matches = [_MARKER_RE.match(f) for f in files]
+    file_dates = [m.groups() for m in matches if m]
+    expired = []
+    removed = []
+    for file_name, date in file_dates:
+        try:
+            is_expired = datetime.date.fromisoformat(date) < today
+        except ValueError:  # impossible date such as 2023-02-30
+            is_expired = False
+        if is_expired:
             print(f'removing "{file_name}" because the date passed')
-            try:
-                uploader.delete_file(file_name)
-            except Exception as e:  # noqa: BLE001
-                print(f"Error: {e}")
-            uploader.delete_file(file_name + "_delete_on_" + date)
+            expired.append(file_name)
+            removed.append(file_name + "_delete_on_" + date)
+        elif file_name == replacing:
+            removed.append(file_name + "_delete_on_" + date)
+    # The data file may already be gone, but a marker that stays would keep
+    # trying to delete a future upload with the same name
+    uploader.delete_files(expired + removed, ignore_missing=expired)
+    return set(removed)
+
+
+def _today() -> datetime.date:
+    """Return the current date in UTC."""
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def _run_uploads(uploads: list[Callable[[], None]], *, concurrent: bool) -> None:
+    """Run the upload calls, in parallel threads if ``concurrent``."""
+    if not concurrent:
+        for upload in uploads:
+            upload()
+        return
+    with ThreadPoolExecutor(max_workers=len(uploads)) as executor:
+        futures = [executor.submit(upload) for upload in uploads]
+        for future in futures:
+            future.result()
 
 
 def fileup(
@@ -246,42 +470,46 @@ def fileup(
     img: bool = False,
 ) -> str:
     """Upload a file to a server and return the url."""
-    path = Path(filename).resolve()
+    path = Path(os.path.abspath(filename))  # noqa: PTH100
     filename_base = path.name
     config = read_config()
 
     # Fix the filename to avoid filename character issues
     filename_base = get_valid_filename(filename_base)
 
+    if config.protocol not in {"ftp", "scp"}:
+        msg = f"Unsupported protocol: {config.protocol}"
+        raise ValueError(msg)
+
+    # Check the local file before connecting to the server
+    if not path.is_file():
+        msg = f"File not found: {path}"
+        raise FileNotFoundError(msg)
+
     # Create the appropriate uploader
     if config.protocol == "ftp":
         uploader: FileUploader = FTPUploader(config)
-    elif config.protocol == "scp":
-        uploader = SCPUploader(config)
     else:
-        msg = f"Unsupported protocol: {config.protocol}"
-        raise ValueError(msg)
+        uploader = SCPUploader(config)
 
     try:
-        today = datetime.datetime.now(datetime.timezone.utc).date()
-        remove_old_files(uploader, today)
-
-        # Delete first if file already exists
-        for f in uploader.list_files():
-            if f.startswith(filename_base) and "_delete_on_" in f:
-                uploader.delete_file(f)
+        today = _today()
+        # Delete expired files, and the old marker if the file already exists
+        remove_old_files(uploader, today, replacing=filename_base)
 
+        uploads: list[Callable[[], None]] = []
         if time != 0:  # could be negative, meaning it should be deleted now
             remove_on = today + datetime.timedelta(days=time)
             filename_date = filename_base + "_delete_on_" + str(remove_on)
             # Create empty marker file for deletion date
-            with tempfile.NamedTemporaryFile() as tmp_file:
-                print("upload " + filename_date)
-                uploader.upload_file(Path(tmp_file.name), filename_date)
+            print("upload " + filename_date)
+            uploads.append(functools.partial(uploader.upload_empty, filename_date))
 
         # Upload the actual file
         print("upload " + filename_base)
-        uploader.upload_file(path, filename_base)
+        uploads.append(functools.partial(uploader.upload_file, path, filename_base))
+
+        _run_uploads(uploads, concurrent=uploader.concurrent_uploads)
 
         # Create URL using file_up_folder instead of folder
         url = (
@@ -304,6 +532,36 @@ def fileup(
         uploader.cleanup()
 
 
+@functools.lru_cache(maxsize=32)
+def _which(name: str) -> str | None:
+    """Locate an executable on ``$PATH``, cached for the process lifetime."""
+    return shutil.which(name)
+
+
+# Clipboard tools for macOS, Wayland, X11 and WSL, in order of preference
+_CLIPBOARD_COMMANDS = (
+    ["pbcopy"],
+    ["wl-copy"],
+    ["xclip", "-selection", "clipboard"],
+    ["clip.exe"],
+)
+
+
+def _copy_to_clipboard(text: str) -> None:
+    """Copy text to the clipboard with the first available tool."""
+    for cmd in _CLIPBOARD_COMMANDS:
+        if _which(cmd[0]):
+            subprocess.run(  # noqa: S603
+                cmd,
+                input=text.encode("utf-8"),
+                env={**os.environ, "LANG": "en_US.UTF-8"},
+                check=False,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            return
+
+
 DESCRIPTION = [
     "Publish a file.\n\n",
     "Create a config file at ~/.config/fileup/config.ini with the following structure:\n",
@@ -347,14 +605,9 @@ def main() -> None:
 
     url = fileup(args.filename, time=args.time, direct=args.direct, img=args.img)
 
-    # Put a URL into clipboard only works on OS X
+    # Put the URL into the clipboard
     with contextlib.suppress(Exception):
-        process = subprocess.Popen(  # noqa: S603
-            "pbcopy",  # noqa: S607
-            env={"LANG": "en_US.UTF-8"},
-            stdin=subprocess.PIPE,
-        )
-        process.communicate(url.encode("utf-8"))
+        _copy_to_clipboard(url)
 
     print("Your url is:", url)
 
@@ -2,11 +2,16 @@
 
 from __future__ import annotations
 
+import argparse
+import dataclasses
 import datetime
-import io
+import ftplib
+import os
+import subprocess
+import tempfile
 from pathlib import Path
-from typing import TYPE_CHECKING
-from unittest.mock import MagicMock, patch
+from typing import TYPE_CHECKING, Any
+from unittest.mock import MagicMock, create_autospec, patch
 
 import pytest
 
@@ -14,6 +19,7 @@ import fileup
 from fileup import FileupConfig
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
     from types import ModuleType
 
     import pytest_mock.plugin
@@ -27,9 +33,11 @@ def test_get_valid_filename() -> None:
     )
 
 
-def test_read_config(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
-    """Test the read_config function."""
-    config_content = """
+@pytest.fixture(scope="session")
+def config_files(tmp_path_factory: pytest.TempPathFactory) -> dict[str, Path]:
+    """Write the config files used by the tests once per session."""
+    contents = {
+        "ftp": """
 [default]
 protocol = ftp
 hostname = example.com
@@ -44,10 +52,42 @@ password = pass
 [scp]
 username = scp_user
 private_key = ~/.ssh/id_rsa
-"""
-    config_file = tmp_path / "config.ini"
-    config_file.write_text(config_content)
-    monkeypatch.setattr(Path, "expanduser", lambda _: config_file)
+""",
+        "scp": """
+[default]
+protocol = scp
+hostname = example.com
+base_folder = /base/folder
+file_up_folder = stuff
+url = files.example.com
+
+[scp]
+username = scp_user
+private_key = ~/.ssh/id_rsa
+""",
+        "invalid": """
+[default]
+protocol = invalid
+hostname = example.com
+base_folder = /base/folder
+file_up_folder = stuff
+url = files.example.com
+""",
+    }
+    config_dir = tmp_path_factory.mktemp("cfg")
+    paths = {}
+    for name, content in contents.items():
+        paths[name] = config_dir / f"{name}.ini"
+        paths[name].write_text(content)
+    return paths
+
+
+def test_read_config(
+    monkeypatch: pytest.MonkeyPatch,
+    config_files: dict[str, Path],
+) -> None:
+    """Test the read_config function."""
+    monkeypatch.setattr(Path, "expanduser", lambda _: config_files["ftp"])
 
     result = fileup.read_config()
     assert isinstance(result, FileupConfig)
@@ -60,23 +100,12 @@ private_key = ~/.ssh/id_rsa
     assert result.password == "pass"  # noqa: S105
 
 
-def test_read_config_scp(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+def test_read_config_scp(
+    monkeypatch: pytest.MonkeyPatch,
+    config_files: dict[str, Path],
+) -> None:
     """Test the read_config function with SCP."""
-    config_content = """
-[default]
-protocol = scp
-hostname = example.com
-base_folder = /base/folder
-file_up_folder = stuff
-url = files.example.com
-
-[scp]
-username = scp_user
-private_key = ~/.ssh/id_rsa
-"""
-    config_file = tmp_path / "config.ini"
-    config_file.write_text(config_content)
-    monkeypatch.setattr(Path, "expanduser", lambda _: config_file)
+    monkeypatch.setattr(Path, "expanduser", lambda _: config_files["scp"])
 
     result = fileup.read_config()
     assert isinstance(result, FileupConfig)
@@ -86,20 +115,51 @@ private_key = ~/.ssh/id_rsa
     assert result.private_key == "~/.ssh/id_rsa"
 
 
-def test_invalid_protocol(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
-    """Test invalid protocol raises ValueError."""
+def test_read_config_cached(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """Test read_config only re-parses the file when it changes.
+
+    Also checks that ``:`` is accepted as a separator, like ConfigParser does.
+    """
     config_content = """
+# comment
 [default]
-protocol = invalid
+protocol: scp
 hostname = example.com
-base_folder = /base/folder
-file_up_folder = stuff
-url = files.example.com
+
+[scp]
+; another comment
+username =
 """
     config_file = tmp_path / "config.ini"
     config_file.write_text(config_content)
     monkeypatch.setattr(Path, "expanduser", lambda _: config_file)
 
+    first = fileup.read_config()
+    assert first.url == "example.com"
+    assert first.username == ""
+    assert first.private_key is None
+    first.hostname = "changed.com"
+    assert fileup.read_config().hostname == "example.com"
+
+    config_file.write_text(config_content.replace("example.com", "other.com"))
+    os.utime(config_file, ns=(0, config_file.stat().st_mtime_ns + 1))
+    assert fileup.read_config().hostname == "other.com"
+
+
+def test_read_config_missing(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """Test a missing config file raises FileNotFoundError."""
+    monkeypatch.setattr(Path, "expanduser", lambda _: tmp_path / "config.ini")
+    with pytest.raises(FileNotFoundError, match="Config file not found"):
+        fileup.read_config()
+
+
+def test_invalid_protocol(
+    monkeypatch: pytest.MonkeyPatch,
+    config_files: dict[str, Path],
+) -> None:
+    """Test invalid protocol raises ValueError."""
+    monkeypatch.setattr(Path, "expanduser", lambda _: config_files["invalid"])
+
     with pytest.raises(ValueError, match="Invalid protocol: invalid"):
         fileup.read_config()
 
@@ -107,9 +167,9 @@ url = files.example.com
 class MockUploader(fileup.FileUploader):
     """Mock uploader for testing."""
 
-    def __init__(self) -> None:
-        """Initialize with test data."""
-        self.files = ["file_delete_on_2000-01-01"]
+    def __init__(self, files: Iterable[str] = ("file_delete_on_2000-01-01",)) -> None:
+        """Initialize with test data, built in one go for bulk scenarios."""
+        self.files = set(files)
 
     def upload_file(
         self,
@@ -117,28 +177,142 @@ class MockUploader(fileup.FileUploader):
         remote_filename: str,
     ) -> None:
         """Mock upload."""
-        self.files.append(remote_filename)
+        self.files.add(remote_filename)
 
     def list_files(self) -> list[str]:
         """Mock list."""
-        return self.files
+        return list(self.files)
 
     def delete_file(self, filename: str) -> None:
         """Mock delete."""
-        self.files.remove(filename)
+        self.files.discard(filename)
 
 
 def test_remove_old_files() -> None:
     """Test the remove_old_files function."""
     uploader = MockUploader()
     today = datetime.date(2023, 1, 1)
-    fileup.remove_old_files(uploader, today)
+    removed = fileup.remove_old_files(uploader, today)
+    assert removed == {"file_delete_on_2000-01-01"}
     assert len(uploader.files) == 0
 
 
-@pytest.fixture
-def mock_config() -> FileupConfig:
-    """Create a mock config."""
+def test_remove_old_files_invalid_date() -> None:
+    """Test markers with an impossible date are left alone."""
+    uploader = MockUploader(["x", "x_delete_on_2023-02-30"])
+    removed = fileup.remove_old_files(uploader, datetime.date(2024, 1, 1))
+    assert removed == set()
+    assert uploader.files == {"x", "x_delete_on_2023-02-30"}
+
+
+def test_remove_old_files_errors(
+    mocker: pytest_mock.plugin.MockerFixture,
+    capsys: pytest.CaptureFixture,
+) -> None:
+    """Test only failures to delete the expired data file are ignored."""
+
+    def fail_on_data_file(filename: str) -> None:
+        if "_delete_on_" not in filename:
+            msg = "No such file"
+            raise OSError(msg)
+
+    uploader = MockUploader()
+    delete_file = mocker.patch.object(uploader, "delete_file")
+    delete_file.side_effect = fail_on_data_file
+    removed = fileup.remove_old_files(uploader, datetime.date(2023, 1, 1))
+    assert removed == {"file_delete_on_2000-01-01"}
+    delete_file.assert_called_with("file_delete_on_2000-01-01")
+    assert "Error: No such file" in capsys.readouterr().out
+
+    delete_file.side_effect = OSError("Permission denied")
+    with pytest.raises(OSError, match="Permission denied"):
+        fileup.remove_old_files(uploader, datetime.date(2023, 1, 1))
+
+
+def test_fileup_own_marker_delete_error(uploaded_env: tuple[Path, MagicMock]) -> None:
+    """Test fileup stops when the old marker of the uploaded file stays."""
+    filename, mock_ftp = uploaded_env
+    mock_ftp.mlsd.return_value = [
+        ("test_file.txt_delete_on_2999-01-01", {"type": "file"}),
+    ]
+    error = ftplib.error_perm("550 Permission denied")  # noqa: S321
+    mock_ftp.delete.side_effect = error
+
+    with pytest.raises(ftplib.error_perm, match="Permission denied"):
+        fileup.fileup(filename, time=90)
+    mock_ftp.storbinary.assert_not_called()
+
+
+def test_remove_old_files_bulk() -> None:
+    """Test remove_old_files with many files, only removing expired ones."""
+    expired = [f"old{i}" for i in range(500)]
+    kept = [f"new{i}" for i in range(500)]
+    uploader = MockUploader(
+        [
+            *expired,
+            *(f"{name}_delete_on_2000-01-01" for name in expired),
+            *kept,
+            *(f"{name}_delete_on_2999-01-01" for name in kept),
+        ],
+    )
+    removed = fileup.remove_old_files(uploader, datetime.date(2023, 1, 1))
+    assert len(removed) == len(expired)
+    assert sorted(uploader.files) == sorted(
+        [*kept, *(f"{name}_delete_on_2999-01-01" for name in kept)],
+    )
+
+
+def test_upload_bytes_default(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    """Test the default upload_bytes goes through a temporary file."""
+    named_tmp_file = mocker.patch("fileup.tempfile.NamedTemporaryFile")
+    tmp_file = named_tmp_file.return_value.__enter__.return_value
+    tmp_file.name = "/fake/tmp_file"
+    uploader = MockUploader()
+    uploader.upload_bytes(b"png-bytes", "image.png")
+    tmp_file.write.assert_called_once_with(b"png-bytes")
+    assert "image.png" in uploader.files
+
+
+def test_fileup_lists_files_once(uploaded_env: tuple[Path, MagicMock]) -> None:
+    """Test fileup lists the remote directory once and skips removed markers."""
+    filename, mock_ftp = uploaded_env
+    mock_ftp.mlsd.return_value = [
+        ("test_file.txt", {"type": "file"}),
+        ("test_file.txt_delete_on_2000-01-01", {"type": "file"}),
+    ]
+
+    fileup.fileup(filename, time=90)
+
+    mock_ftp.mlsd.assert_called_once()
+    deleted = [call[0][0] for call in mock_ftp.delete.call_args_list]
+    assert deleted == ["test_file.txt", "test_file.txt_delete_on_2000-01-01"]
+
+
+def test_fileup_replaces_own_marker(
+    mocker: pytest_mock.plugin.MockerFixture,
+    uploaded_env: tuple[Path, MagicMock],
+) -> None:
+    """Test fileup only replaces the deletion marker of the uploaded file."""
+    mocker.patch("fileup._today", return_value=datetime.date(2023, 1, 1))
+    filename, mock_ftp = uploaded_env
+    mock_ftp.mlsd.return_value = [
+        ("test_file.txt_delete_on_2999-01-01", {"type": "file"}),
+        ("test_file.txt.bak_delete_on_2999-01-01", {"type": "file"}),
+    ]
+
+    fileup.fileup(filename, time=90)
+
+    mock_ftp.delete.assert_called_once_with("test_file.txt_delete_on_2999-01-01")
+    stored = [
+        call[0][0].split(" ", 1)[1] for call in mock_ftp.storbinary.call_args_list
+    ]
+    matches = [fileup._MARKER_RE.match(name) for name in stored]
+    assert [m.groups() for m in matches if m] == [("test_file.txt", "2023-04-01")]
+
+
+@pytest.fixture(scope="session")
+def base_config() -> FileupConfig:
+    """Create the config that mock_config copies, never modify it."""
     return FileupConfig(
         protocol="ftp",
         hostname="example.com",
@@ -151,58 +325,87 @@ def mock_config() -> FileupConfig:
 
 
 @pytest.fixture
-def mock_fileup(
-    mocker: pytest_mock.plugin.MockerFixture,
-    mock_config: FileupConfig,
-) -> ModuleType:
-    """Mock the fileup module."""
-    mocker.patch("fileup.read_config", return_value=mock_config)
-    mocker.patch("fileup.ftplib.FTP", autospec=True)
-    mocker.patch("fileup.Path.resolve", return_value="mocked_path")
-    mocker.patch("fileup.Path.name", return_value="mocked_file_name")
-    mocker.patch("fileup.tempfile.TemporaryFile")
-    mocker.patch("fileup.Path.open")
-    return fileup
+def mock_config(base_config: FileupConfig) -> FileupConfig:
+    """Create a mock config that tests may modify."""
+    return dataclasses.replace(base_config)
 
 
 @pytest.fixture
-def mock_temp_file(
-    mocker: pytest_mock.plugin.MockerFixture,
+def scp_config(
+    monkeypatch: pytest.MonkeyPatch,
     tmp_path: Path,
-) -> MagicMock:
-    """Create a mock temporary file."""
-    # Create a real temporary file
-    temp_file = tmp_path / "temp_marker"
-    temp_file.write_text("")
+    mock_config: FileupConfig,
+) -> FileupConfig:
+    """Create an SCP config, keeping SSH control directories in ``tmp_path``."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return dataclasses.replace(mock_config, protocol="scp")
 
-    # Create a mock file object
-    mock_file = MagicMock(spec=io.BytesIO)
-    mock_file.name = str(temp_file)
 
-    # Create a mock context manager
-    mock_context = MagicMock()
-    mock_context.__enter__.return_value = mock_file
-    mock_context.__exit__.return_value = None
+@pytest.fixture(scope="session")
+def ftp_spec() -> MagicMock:
+    """Autospec ``ftplib.FTP`` once, introspecting the class is slow."""
+    return create_autospec(ftplib.FTP)
 
-    # Patch TemporaryFile to return our mock
-    mocker.patch("tempfile.TemporaryFile", return_value=mock_context)
-    return mock_file
 
+@pytest.fixture
+def mock_ftp(
+    mocker: pytest_mock.plugin.MockerFixture,
+    ftp_spec: MagicMock,
+) -> MagicMock:
+    """Patch ``ftplib.FTP`` and return the connection it creates."""
+    ftp_spec.reset_mock()
+    connection = ftp_spec.return_value
+    connection.reset_mock(return_value=True, side_effect=True)
+    # No existing files, whether listed with MLSD or NLST
+    connection.mlsd.return_value = []
+    connection.nlst.return_value = []
+    mocker.patch("ftplib.FTP", ftp_spec)
+    return connection
 
-def test_file_up_ftp(
+
+@pytest.fixture
+def patched_read_config(
     mocker: pytest_mock.plugin.MockerFixture,
-    tmp_path: Path,
     mock_config: FileupConfig,
-    mock_temp_file: MagicMock,  # noqa: ARG001
-) -> None:
-    """Test the fileup function with FTP."""
+) -> FileupConfig:
+    """Make ``fileup.read_config`` return ``mock_config``."""
     mocker.patch("fileup.read_config", return_value=mock_config)
-    mock_ftp = MagicMock()
-    mock_ftp.nlst.return_value = []  # No existing files
-    mocker.patch("ftplib.FTP", return_value=mock_ftp)
+    return mock_config
+
 
+@pytest.fixture
+def uploaded_env(
+    tmp_path: Path,
+    patched_read_config: FileupConfig,  # noqa: ARG001
+    mock_ftp: MagicMock,
+) -> tuple[Path, MagicMock]:
+    """Patch the config and FTP connection and create a file to upload."""
     filename = tmp_path / "test_file.txt"
     filename.write_text("test")
+    return filename, mock_ftp
+
+
+@pytest.fixture
+def mock_fileup(
+    mocker: pytest_mock.plugin.MockerFixture,
+    patched_read_config: FileupConfig,  # noqa: ARG001
+) -> ModuleType:
+    """Mock the fileup module."""
+    mocker.patch("fileup.ftplib.FTP")
+    mocker.patch.multiple(
+        "fileup.Path",
+        resolve=MagicMock(return_value="mocked_path"),
+        name=MagicMock(return_value="mocked_file_name"),
+        open=mocker.DEFAULT,
+    )
+    return fileup
+
+
+def test_file_up_ftp(
+    uploaded_env: tuple[Path, MagicMock],
+) -> None:
+    """Test the fileup function with FTP."""
+    filename, mock_ftp = uploaded_env
 
     url = fileup.fileup(filename, time=90, direct=False, img=False)
     assert url == "http://files.example.com/stuff/test_file.txt"
@@ -221,14 +424,12 @@ def test_file_up_ftp(
 def test_file_up_scp(
     mocker: pytest_mock.plugin.MockerFixture,
     tmp_path: Path,
-    mock_config: FileupConfig,
-    mock_temp_file: MagicMock,  # noqa: ARG001
+    patched_read_config: FileupConfig,
 ) -> None:
     """Test the fileup function with SCP."""
-    mock_config.protocol = "scp"
-    mocker.patch("fileup.read_config", return_value=mock_config)
+    patched_read_config.protocol = "scp"
     mock_run = mocker.patch("subprocess.run")
-    mock_run.return_value.stdout = ""  # Empty file list
+    mock_run.return_value.stdout = b""  # Empty file list
 
     filename = tmp_path / "test_file.txt"
     filename.write_text("test")
@@ -236,49 +437,73 @@ def test_file_up_scp(
     url = fileup.fileup(filename, time=90, direct=False, img=False)
     assert url == "http://files.example.com/stuff/test_file.txt"
 
-    # Verify SCP operations
-    assert mock_run.call_count >= 1
+    # Verify SCP operations, the marker and file are uploaded separately
+    commands = [call[0][0] for call in mock_run.call_args_list]
+    assert any(cmd[0] == "scp" for cmd in commands)
+    assert any(cmd[-1].startswith("cat > ") for cmd in commands)
 
     # Test direct URL
     url = fileup.fileup(filename, time=90, direct=True, img=False)
     assert url == "http://files.example.com/stuff/test_file.txt"
 
 
+@pytest.mark.parametrize(
+    ("options", "clipboard_error"),
+    [
+        ({"time": 90, "direct": False, "img": False}, None),
+        ({"time": 90, "direct": False, "img": False}, OSError("Clipboard")),
+        ({"time": 30, "direct": True, "img": True}, None),
+    ],
+    ids=["default", "clipboard-error", "all-options"],
+)
+@pytest.mark.usefixtures("mock_fileup")
 def test_main(
-    mock_fileup: MagicMock,
     mocker: pytest_mock.plugin.MockerFixture,
-    monkeypatch: pytest.MonkeyPatch,
     capsys: pytest.CaptureFixture,
+    options: dict[str, Any],
+    clipboard_error: Exception | None,
 ) -> None:
     """Test the main function."""
-    test_args = ["test_file.txt", "-t", "90"]
-    monkeypatch.setattr("sys.argv", ["fileup", *test_args])
+    url = "http://files.example.com/stuff/mocked_file_name"
     mocker.patch(
-        "fileup.fileup",
-        return_value="http://files.example.com/stuff/mocked_file_name",
+        "argparse.ArgumentParser.parse_args",
+        return_value=argparse.Namespace(filename="test_file.txt", **options),
+    )
+    mock_upload = mocker.patch("fileup.fileup", return_value=url)
+    mock_copy = mocker.patch(
+        "fileup._copy_to_clipboard",
+        side_effect=clipboard_error,
     )
-    mock_fileup.main()
+
+    # A failing clipboard copy should not raise
+    fileup.main()
+    mock_upload.assert_called_once_with("test_file.txt", **options)
+    mock_copy.assert_called_once_with(url)
     captured = capsys.readouterr()
-    assert (
-        captured.out.strip()
-        == "Your url is: http://files.example.com/stuff/mocked_file_name"
+    assert captured.out.strip() == f"Your url is: {url}"
+
+
+@pytest.mark.usefixtures("mock_fileup")
+def test_main_parses_options(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    """Test main parses all command line options."""
+    mocker.patch("sys.argv", ["fileup", "test_file.txt", "-t", "30", "-d", "-i"])
+    mock_upload = mocker.patch("fileup.fileup", return_value="http://example.com")
+    mocker.patch("fileup._copy_to_clipboard")
+
+    fileup.main()
+    mock_upload.assert_called_once_with(
+        "test_file.txt",
+        time=30,
+        direct=True,
+        img=True,
     )
 
 
 def test_zero_time_no_deletion(
-    mocker: pytest_mock.plugin.MockerFixture,
-    tmp_path: Path,
-    mock_config: FileupConfig,
-    mock_temp_file: MagicMock,  # noqa: ARG001
+    uploaded_env: tuple[Path, MagicMock],
 ) -> None:
     """Test that time=0 means no deletion marker."""
-    mocker.patch("fileup.read_config", return_value=mock_config)
-    mock_ftp = MagicMock()
-    mock_ftp.nlst.return_value = []
-    mocker.patch("ftplib.FTP", return_value=mock_ftp)
-
-    filename = tmp_path / "test_file.txt"
-    filename.write_text("test")
+    filename, mock_ftp = uploaded_env
     fileup.fileup(filename, time=0)
 
     # Verify no deletion marker was created
@@ -290,128 +515,241 @@ def test_zero_time_no_deletion(
     assert len(delete_marker) == 0
 
 
-def test_ftp_uploader_invalid_config() -> None:
+def test_ftp_uploader_invalid_config(base_config: FileupConfig) -> None:
     """Test FTPUploader with invalid config."""
-    config = FileupConfig(
-        protocol="ftp",
-        hostname="example.com",
-        base_folder="/base",
-        file_up_folder="files",
-        url="example.com",
-    )
+    config = dataclasses.replace(base_config, username=None, password=None)
     with pytest.raises(ValueError, match="FTP requires username and password"):
         fileup.FTPUploader(config)
 
 
-def test_ftp_uploader_file_not_exists(mock_config: FileupConfig) -> None:
+def test_ftp_uploader_file_not_exists(
+    mock_config: FileupConfig,
+    mock_ftp: MagicMock,
+) -> None:
     """Test FTPUploader with non-existent file."""
-    mock_ftp = MagicMock()
-    with patch("ftplib.FTP", return_value=mock_ftp):
-        uploader = fileup.FTPUploader(mock_config)
+    uploader = fileup.FTPUploader(mock_config)
+    with pytest.raises(FileNotFoundError):
         uploader.upload_file(Path("nonexistent.txt"), "remote.txt")
-        mock_ftp.storbinary.assert_called_once()
+    mock_ftp.storbinary.assert_not_called()
 
 
-def test_fileup_ipynb(
-    mocker: pytest_mock.plugin.MockerFixture,
-    tmp_path: Path,
+def test_ftp_uploader_list_files(
     mock_config: FileupConfig,
+    mock_ftp: MagicMock,
 ) -> None:
-    """Test fileup with Jupyter notebook."""
-    mocker.patch("fileup.read_config", return_value=mock_config)
-    mock_ftp = MagicMock()
-    mock_ftp.nlst.return_value = []
-    mocker.patch("ftplib.FTP", return_value=mock_ftp)
+    """Test FTPUploader lists files with MLSD and falls back to NLST."""
+    mock_ftp.mlsd.return_value = [
+        (".", {"type": "cdir"}),
+        ("subdir", {"type": "dir"}),
+        ("file.txt", {"type": "file"}),
+        ("other.txt", {"type": "File"}),
+    ]
+    uploader = fileup.FTPUploader(mock_config)
+    assert uploader.list_files() == ["file.txt", "other.txt"]
+    mock_ftp.nlst.assert_not_called()
 
-    filename = tmp_path / "test.ipynb"
+    mock_ftp.mlsd.side_effect = ftplib.error_perm("500 Unknown command")  # noqa: S321
+    mock_ftp.nlst.return_value = ["file.txt"]
+    assert uploader.list_files() == ["file.txt"]
+
+
+def test_fileup_ipynb(uploaded_env: tuple[Path, MagicMock]) -> None:
+    """Test fileup with Jupyter notebook."""
+    filename = uploaded_env[0].with_name("test.ipynb")
     filename.write_text("{}")
 
     url = fileup.fileup(filename, time=90)
     assert "nbviewer.jupyter.org" in url
 
 
-def test_main_clipboard_error(
-    mock_fileup: MagicMock,  # noqa: ARG001
+def test_copy_to_clipboard_without_tool(
     mocker: pytest_mock.plugin.MockerFixture,
-    monkeypatch: pytest.MonkeyPatch,
-    capsys: pytest.CaptureFixture,
 ) -> None:
-    """Test main function when clipboard operation fails."""
-    test_args = ["test_file.txt"]
-    monkeypatch.setattr("sys.argv", ["fileup", *test_args])
+    """Test nothing is spawned when no clipboard tool is installed."""
+    mocker.patch("fileup._which", return_value=None)
+    mock_run = mocker.patch("subprocess.run")
+
+    fileup._copy_to_clipboard("http://example.com/file")
+    mock_run.assert_not_called()
+
+
+def test_copy_to_clipboard(mocker: pytest_mock.plugin.MockerFixture) -> None:
+    """Test the first available clipboard tool is used."""
     mocker.patch(
-        "fileup.fileup",
-        return_value="http://example.com/file",
+        "fileup._which",
+        side_effect=lambda name: "/usr/bin/xclip" if name == "xclip" else None,
     )
-    # Make subprocess.Popen raise an exception
-    mocker.patch("subprocess.Popen", side_effect=Exception("Clipboard error"))
+    mock_run = mocker.patch("subprocess.run")
 
-    # Should not raise exception
-    fileup.main()
-    captured = capsys.readouterr()
-    assert "Your url is:" in captured.out
+    fileup._copy_to_clipboard("http://example.com/file")
+    mock_run.assert_called_once()
+    assert mock_run.call_args[0][0] == ["xclip", "-selection", "clipboard"]
+    assert mock_run.call_args[1]["input"] == b"http://example.com/file"
 
 
-def test_unsupported_protocol(
-    mocker: pytest_mock.plugin.MockerFixture,
-    mock_config: FileupConfig,
-) -> None:
+def test_unsupported_protocol(patched_read_config: FileupConfig) -> None:
     """Test fileup with unsupported protocol."""
-    mock_config.protocol = "unsupported"
-    mocker.patch("fileup.read_config", return_value=mock_config)
+    patched_read_config.protocol = "unsupported"
 
     with pytest.raises(ValueError, match="Unsupported protocol: unsupported"):
         fileup.fileup("test.txt")
 
 
-def test_scp_uploader_with_username(mock_config: FileupConfig) -> None:
-    """Test SCPUploader with username."""
-    mock_config.protocol = "scp"
-    mock_config.username = "test_user"
+@pytest.mark.usefixtures("patched_read_config", "mock_ftp")
+def test_missing_file_does_not_connect(tmp_path: Path, ftp_spec: MagicMock) -> None:
+    """Test fileup fails on a missing file before opening a connection."""
+    with pytest.raises(FileNotFoundError, match="File not found"):
+        fileup.fileup(tmp_path / "missing.txt")
+    ftp_spec.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("changes", "expected"),
+    [
+        ({"username": "test_user"}, ["test_user@example.com:"]),
+        ({"private_key": "~/.ssh/id_rsa"}, ["-i", "~/.ssh/id_rsa"]),
+    ],
+    ids=["username", "private-key"],
+)
+def test_scp_uploader_options(
+    scp_config: FileupConfig,
+    changes: dict[str, str],
+    expected: list[str],
+) -> None:
+    """Test SCPUploader passes the username and private key to scp."""
+    config = dataclasses.replace(scp_config, **changes)
     mock_run = MagicMock()
     with patch("subprocess.run", mock_run):
-        uploader = fileup.SCPUploader(mock_config)
+        uploader = fileup.SCPUploader(config)
         uploader.upload_file(Path("test.txt"), "remote.txt")
 
-        # Check if username was used in command
         cmd = mock_run.call_args[0][0]
-        assert "test_user@example.com" in cmd[-1]
+        assert " ".join(expected) in " ".join(cmd)
 
 
-def test_scp_uploader_with_private_key(mock_config: FileupConfig) -> None:
-    """Test SCPUploader with private key."""
-    mock_config.protocol = "scp"
-    mock_config.private_key = "~/.ssh/id_rsa"
+def test_scp_uploader_upload_empty(scp_config: FileupConfig) -> None:
+    """Test SCPUploader creates marker files without a local file."""
     mock_run = MagicMock()
     with patch("subprocess.run", mock_run):
-        uploader = fileup.SCPUploader(mock_config)
-        uploader.upload_file(Path("test.txt"), "remote.txt")
+        uploader = fileup.SCPUploader(scp_config)
+        uploader.upload_empty("remote.txt_delete_on_2000-01-01")
 
-        # Check if private key was used in command
         cmd = mock_run.call_args[0][0]
-        assert "-i" in cmd
-        assert "~/.ssh/id_rsa" in cmd
+        assert cmd[0] == "ssh"
+        assert cmd[-1] == "cat > /base/folder/stuff/remote.txt_delete_on_2000-01-01"
+        assert mock_run.call_args[1]["input"] == b""
 
 
-def test_main_with_all_options(
-    mocker: pytest_mock.plugin.MockerFixture,
-    monkeypatch: pytest.MonkeyPatch,
-    capsys: pytest.CaptureFixture,  # noqa: ARG001
+def test_scp_uploader_home_base_folder(scp_config: FileupConfig) -> None:
+    """Test SCPUploader lets the remote shell expand a leading ``~``."""
+    config = dataclasses.replace(scp_config, base_folder="~/public_html")
+    mock_run = MagicMock()
+    with patch("subprocess.run", mock_run):
+        uploader = fileup.SCPUploader(config)
+        uploader.upload_empty("my file.txt_delete_on_2000-01-01")
+
+        cmd = mock_run.call_args[0][0]
+        assert cmd[-1] == "cat > ~/'public_html/stuff/my file.txt_delete_on_2000-01-01'"
+
+        uploader.list_files()
+        assert mock_run.call_args[0][0][-1] == "ls -1 ~/public_html/stuff"
+        uploader.delete_file("a.txt")
+        assert mock_run.call_args[0][0][-1] == "rm ~/public_html/stuff/a.txt"
+        uploader.delete_files(["a.txt"])
+        assert mock_run.call_args[0][0][-1] == (
+            "cd ~/public_html/stuff && rm -f -- a.txt"
+        )
+
+    assert fileup._quote_remote_path("~") == "~"
+    assert fileup._quote_remote_path("/srv/my dir") == "'/srv/my dir'"
+
+
+def test_ftp_uploader_upload_bytes(
+    mock_config: FileupConfig,
+    mock_ftp: MagicMock,
 ) -> None:
-    """Test main function with all command line options."""
-    test_args = ["test_file.txt", "-t", "30", "-d", "-i"]
-    monkeypatch.setattr("sys.argv", ["fileup", *test_args])
-    mock_fileup = mocker.patch(
-        "fileup.fileup",
-        return_value="http://example.com/file",
-    )
+    """Test FTPUploader uploads in-memory data without a local file."""
+    uploader = fileup.FTPUploader(mock_config)
+    uploader.upload_bytes(b"data", "remote.txt")
+    command, file = mock_ftp.storbinary.call_args[0]
+    assert command == "STOR remote.txt"
+    assert file.read() == b"data"
+    assert mock_ftp.storbinary.call_args[1]["blocksize"] == 1 << 20
 
-    fileup.main()
 
-    # Verify fileup was called with all options
-    mock_fileup.assert_called_once_with(
-        "test_file.txt",
-        time=30,
-        direct=True,
-        img=True,
-    )
+def test_scp_uploader_control_master(
+    scp_config: FileupConfig,
+    tmp_path: Path,
+) -> None:
+    """Test SCPUploader shares one SSH connection and closes it on cleanup."""
+    mock_run = MagicMock()
+    with patch("subprocess.run", mock_run):
+        uploader = fileup.SCPUploader(scp_config)
+        assert uploader._control_dir is None
+        uploader.list_files()
+        assert uploader._control_dir is not None
+        control_dir = Path(uploader._control_dir)
+        assert control_dir.parent == tmp_path
+        cmd = mock_run.call_args[0][0]
+        assert f"ControlPath={control_dir / 'ssh.sock'}" in cmd
+        assert "ControlMaster=auto" in cmd
+
+        # Pretend the master connection was started
+        (control_dir / "ssh.sock").touch()
+        uploader.cleanup()
+        cmd = mock_run.call_args[0][0]
+        assert cmd[-3:] == ["-O", "exit", "user@example.com"]
+        assert not control_dir.exists()
+
+
+def test_scp_uploader_delete_files(scp_config: FileupConfig) -> None:
+    """Test SCPUploader deletes several files with a single ssh call."""
+    mock_run = MagicMock()
+    with patch("subprocess.run", mock_run):
+        uploader = fileup.SCPUploader(scp_config)
+        uploader.delete_files([])
+        mock_run.assert_not_called()
+
+        uploader.delete_files(["a.txt", "a.txt_delete_on_2000-01-01"])
+        mock_run.assert_called_once()
+        cmd = mock_run.call_args[0][0]
+        assert cmd[-1] == (
+            "cd /base/folder/stuff && rm -f -- a.txt a.txt_delete_on_2000-01-01"
+        )
+
+
+def test_remove_old_files_single_batch(scp_config: FileupConfig) -> None:
+    """Test expired files and replaced markers are deleted with one command."""
+    mock_run = MagicMock()
+    with patch("subprocess.run", mock_run):
+        uploader = fileup.SCPUploader(scp_config)
+        removed = fileup.remove_old_files(
+            uploader,
+            datetime.date(2023, 1, 1),
+            ["a", "a_delete_on_2000-01-01", "b", "b_delete_on_2999-01-01", "c"],
+            replacing="b",
+        )
+
+        assert removed == {"a_delete_on_2000-01-01", "b_delete_on_2999-01-01"}
+        mock_run.assert_called_once()
+        assert mock_run.call_args[0][0][-1] == (
+            "cd /base/folder/stuff && rm -f -- a a_delete_on_2000-01-01"
+            " b_delete_on_2999-01-01"
+        )
+
+
+def test_scp_uploader_error(scp_config: FileupConfig) -> None:
+    """Test SCPUploader reports the stderr of a failing command."""
+    error = subprocess.CalledProcessError(1, ["ssh"], stderr=b"No such file\n")
+    with patch("subprocess.run", side_effect=error):
+        uploader = fileup.SCPUploader(scp_config)
+        with pytest.raises(
+            subprocess.CalledProcessError,
+            match="exit code 1: No such file",
+        ):
+            uploader.delete_file("remote.txt")
+        with pytest.raises(
+            subprocess.CalledProcessError,
+            match="exit code 1: No such file",
+        ):
+            uploader.delete_files(["remote.txt"])